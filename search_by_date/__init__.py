@@ -3,14 +3,21 @@ import azure.functions as func
 import logging
 import json
 import html
-import requests
+import asyncio
+import functools
+import threading
+import httpx
+import ijson
+import orjson
 import re
-from datetime import datetime, timedelta
-from dateutil.parser import parse as parse_date
-from azure.identity import DefaultAzureCredential
+from datetime import date, datetime, timedelta
+from typing import Optional
+from azure.identity import AzureCliCredential, ChainedTokenCredential, EnvironmentCredential, ManagedIdentityCredential
 from azure.ai.projects import AIProjectClient
 from azure.ai.agents.models import ListSortOrder
 
+logger = logging.getLogger(__name__)
+
 # 🔧 Configuration from environment
 AI_PROJECT_ENDPOINT = os.getenv("AI_PROJECT_ENDPOINT")
 AGENT_ID = os.getenv("AGENT_ID")
@@ -21,72 +28,150 @@ AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX")
 AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY")
 
-# 🔌 Initialize AI Project client
-try:
-    project = AIProjectClient(
-        credential=DefaultAzureCredential(),
-        endpoint=AI_PROJECT_ENDPOINT
+# 🧩 Precompiled patterns
+_JSON_RE = re.compile(r'\{[^{}]*\}')
+
+# 🌐 Shared async HTTP client (kept alive across invocations of this worker)
+_ACLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(30, connect=3.05),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        retries=2
     )
-    logging.info("✅ AIProjectClient initialized")
-except Exception as e:
-    logging.warning(f"⚠️ Failed to initialize AIProjectClient: {e}")
-    project = None
+)
+
+# 🔑 Credential chain pruned to the sources we deploy with: app settings, managed identity, local `az login`
+_CRED = ChainedTokenCredential(
+    EnvironmentCredential(),
+    ManagedIdentityCredential(client_id=os.getenv("AZURE_CLIENT_ID")),
+    AzureCliCredential()
+)
+
+# 🔌 AI Project client, created on first use to keep it off the cold-start path
+_project = None
+_project_lock = threading.Lock()
+
+def get_project() -> Optional[AIProjectClient]:
+    global _project
+    if _project is None:
+        with _project_lock:
+            if _project is None:
+                try:
+                    _project = AIProjectClient(
+                        credential=_CRED,
+                        endpoint=AI_PROJECT_ENDPOINT
+                    )
+                    logger.info("✅ AIProjectClient initialized")
+                except Exception as e:
+                    logger.warning("⚠️ Failed to initialize AIProjectClient: %s", e)
+    return _project
+
+# 🤖 Agent handle is static for the worker lifetime, fetch it once
+@functools.lru_cache(maxsize=1)
+def _get_agent():
+    return get_project().agents.get_agent(AGENT_ID)
 
 # 📅 Date parsing via Foundry Agent
 def call_date_parser_agent(user_query: str) -> dict:
+    project = get_project()
     if not project:
         raise ValueError("AI Project client unavailable")
     try:
-        agent = project.agents.get_agent(AGENT_ID)
+        agent = _get_agent()
         thread = project.agents.threads.create()
         project.agents.messages.create(thread_id=thread.id, role="user", content=user_query)
         run = project.agents.runs.create_and_process(thread_id=thread.id, agent_id=agent.id)
         if run.status == "failed":
             raise ValueError(f"Agent failed: {run.last_error}")
-        messages = project.agents.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
+        # Newest first: the agent's reply is the last message in the thread
+        messages = project.agents.messages.list(thread_id=thread.id, order=ListSortOrder.DESCENDING, limit=1)
+        response_text = None
         for msg in messages:
             if msg.role == "assistant" and msg.text_messages:
                 response_text = msg.text_messages[-1].text.value.strip()
-                if response_text.startswith('{') and response_text.endswith('}'):
-                    return json.loads(response_text)
-                match = re.search(r'\{.*?\}', response_text)
-                if match:
-                    return json.loads(match.group())
+                break
+        if response_text:
+            if response_text.startswith('{') and response_text.endswith('}'):
+                return json.loads(response_text)
+            match = _JSON_RE.search(response_text)
+            if match:
+                return json.loads(match.group())
         raise ValueError("No valid JSON output from agent")
     except Exception as e:
-        logging.error(f"❌ Date parser agent error: {e}")
+        logger.error("❌ Date parser agent error: %s", e)
         raise
 
+# 🗃️ Memoize agent answers per normalized query; the day in the key keeps relative dates ("hoy") correct
+@functools.lru_cache(maxsize=4096)
+def _cached_date_parse(query_norm: str, day: str) -> dict:
+    return call_date_parser_agent(query_norm)
+
+def _normalize_query(user_query: str) -> str:
+    return " ".join(user_query.lower().split())
+
 # 📅 Fallback parser (basic heuristic)
-def fallback_date_parser(user_query: str) -> dict:
-    today = datetime.utcnow().date()
-    q = user_query.lower()
-    if "última semana" in q or "semana pasada" in q:
-        start = today - timedelta(days=today.weekday() + 7)
-        end = start + timedelta(days=6)
-        return {"start": start.isoformat(), "end": end.isoformat()}
-    elif "ayer" in q:
-        return {"date": (today - timedelta(days=1)).isoformat()}
-    elif "hoy" in q:
-        return {"date": today.isoformat()}
-    else:
-        last_month = today.replace(day=1) - timedelta(days=1)
-        start_last = last_month.replace(day=1)
-        return {"start": start_last.isoformat(), "end": last_month.isoformat()}
+def _last_week(today: date) -> dict:
+    start = today - timedelta(days=today.weekday() + 7)
+    end = start + timedelta(days=6)
+    return {"start": start.isoformat(), "end": end.isoformat()}
+
+def _yesterday(today: date) -> dict:
+    return {"date": (today - timedelta(days=1)).isoformat()}
+
+def _today(today: date) -> dict:
+    return {"date": today.isoformat()}
+
+def _last_month(today: date) -> dict:
+    last_month = today.replace(day=1) - timedelta(days=1)
+    start_last = last_month.replace(day=1)
+    return {"start": start_last.isoformat(), "end": last_month.isoformat()}
+
+_FALLBACK_RE = re.compile(
+    r'(?P<last_month>mes pasado|último mes)'
+    r'|(?P<last_week>semana pasada|última semana)'
+    r'|(?P<yesterday>ayer)'
+    r'|(?P<today>hoy)'
+)
+_FALLBACK_HANDLERS = {
+    "last_month": _last_month,
+    "last_week": _last_week,
+    "yesterday": _yesterday,
+    "today": _today,
+}
+
+# ⚡ Queries that are nothing but a known phrase ("ayer", "la semana pasada") skip the agent
+_FAST_RE = re.compile(rf'(?:(?:el|la)\s+)?(?:{_FALLBACK_RE.pattern})')
+
+def _fast_classify(user_query: str, today: date) -> Optional[dict]:
+    match = _FAST_RE.fullmatch(_normalize_query(user_query).strip("¿?¡!.,"))
+    if not match:
+        return None
+    return _FALLBACK_HANDLERS[match.lastgroup](today)
+
+def fallback_date_parser(user_query: str, today: Optional[date] = None) -> dict:
+    today = today or datetime.utcnow().date()
+    match = _FALLBACK_RE.search(user_query.lower())
+    handler = _FALLBACK_HANDLERS.get(match.lastgroup if match else None, _last_month)
+    return handler(today)
 
 # 🔍 Build Cognitive Search filter expression
 def build_filter_expression(date_data: dict) -> str:
-    if "date" in date_data:
-        d = parse_date(date_data["date"]).date().isoformat()
+    return _build_filter_cached(date_data.get("date"), date_data.get("start"), date_data.get("end"))
+
+@functools.lru_cache(maxsize=2048)
+def _build_filter_cached(day: Optional[str], start: Optional[str], end: Optional[str]) -> str:
+    if day is not None:
+        d = date.fromisoformat(day[:10]).isoformat()
         return f"metadata_spo_item_release_date eq {d}T00:00:00Z"
-    elif "start" in date_data and "end" in date_data:
-        start = parse_date(date_data["start"]).date().isoformat()
-        end = parse_date(date_data["end"]).date().isoformat()
+    elif start is not None and end is not None:
+        start = date.fromisoformat(start[:10]).isoformat()
+        end = date.fromisoformat(end[:10]).isoformat()
         return f"(metadata_spo_item_release_date ge {start}T00:00:00Z and metadata_spo_item_release_date le {end}T23:59:59Z)"
     return ""
 
 # 🎯 Query AOYD (RAG agent) with filter
-def call_rag_agent_with_filter(user_query: str, filter_expression: str) -> dict:
+async def call_rag_agent_with_filter(user_query: str, filter_expression: str) -> str:
     url = f"{AZURE_OAI_ENDPOINT}/openai/deployments/{MAIN_AGENT_DEPLOYMENT}/extensions/chat/completions?api-version=2023-10-01-preview"
     headers = {
         "Content-Type": "application/json",
@@ -112,55 +197,111 @@ def call_rag_agent_with_filter(user_query: str, filter_expression: str) -> dict:
         "max_tokens": 800
     }
     try:
-        logging.info("📡 Calling AOYD with filter: " + filter_expression)
-        response = requests.post(url, headers=headers, json=body)
-        response.raise_for_status()
-        return response.json()
+        logger.info("📡 Calling AOYD with filter: %s", filter_expression)
+        # Stream-parse only the answer; the citations context in the body is never materialized
+        answers = ijson.sendable_list()
+        parser = ijson.items_coro(answers, "choices.item.message.content")
+        async with _ACLIENT.stream("POST", url, headers=headers, json=body) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                parser.send(chunk)
+        parser.close()
+        if not answers:
+            raise ValueError("No answer in AOYD response")
+        return answers[0]
     except Exception as e:
-        logging.error(f"🚫 AOYD call failed: {e}")
+        logger.error("🚫 AOYD call failed: %s", e)
         raise
 
+# 🧭 Full pipeline for one query; None when no date could be resolved
+async def process_query(raw_query: str) -> Optional[dict]:
+    user_query = html.unescape(raw_query)
+    logger.info("🗣️ Received query: %s", user_query)
+
+    # Step 1: Date parsing
+    today = datetime.utcnow().date()
+    parsed_date_info = _fast_classify(user_query, today)
+    if parsed_date_info is None:
+        try:
+            parsed_date_info = await asyncio.to_thread(_cached_date_parse, _normalize_query(user_query), today.isoformat())
+        except Exception as e:
+            logger.warning("⚠️ Agent fallback triggered: %s", e)
+            parsed_date_info = fallback_date_parser(user_query, today)
+
+    # Step 2: Build filter
+    filter_expression = build_filter_expression(parsed_date_info)
+    if not filter_expression:
+        return None
+
+    # Step 3: Call AOYD
+    gpt_answer = await call_rag_agent_with_filter(user_query, filter_expression)
+
+    return {
+        "parsed_dates": parsed_date_info,
+        "filter": filter_expression,
+        "gpt_answer": gpt_answer
+    }
+
+# 📦 Batch mode: POST {"q": [...]} runs queries concurrently, results map 1:1 to inputs
+MAX_BATCH_QUERIES = 20
+BATCH_CONCURRENCY = 8
+_batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+async def _process_bounded(raw_query: str) -> Optional[dict]:
+    # Shared across requests so batches cannot flood the agent thread pool or the HTTP pool
+    async with _batch_semaphore:
+        return await process_query(raw_query)
+
+async def process_batch(queries: list) -> list:
+    results = await asyncio.gather(*[_process_bounded(q) for q in queries], return_exceptions=True)
+    output = []
+    for query, result in zip(queries, results):
+        if isinstance(result, Exception):
+            logger.error("🔥 Batch query failed: %s: %s", query, result)
+            output.append({"error": str(result)})
+        elif result is None:
+            output.append({"error": "No valid date found in query."})
+        else:
+            output.append(result)
+    return output
+
 # 🚀 Azure Function entrypoint
-def main(req: func.HttpRequest) -> func.HttpResponse:
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
+        if req.method == "POST":
+            try:
+                queries = req.get_json().get("q")
+            except (ValueError, AttributeError):
+                queries = None
+            if not isinstance(queries, list) or not queries:
+                return func.HttpResponse("Body must be a JSON object with a non-empty 'q' list", status_code=400)
+            if len(queries) > MAX_BATCH_QUERIES:
+                return func.HttpResponse(f"Too many queries in batch (max {MAX_BATCH_QUERIES})", status_code=400)
+            return func.HttpResponse(
+                orjson.dumps(await process_batch(queries)),
+                mimetype="application/json",
+                status_code=200
+            )
+
         raw_query = req.params.get("q")
         if not raw_query:
             return func.HttpResponse("Missing 'q' parameter", status_code=400)
 
-        user_query = html.unescape(raw_query)
-        logging.info(f"🗣️ Received query: {user_query}")
-
-        # Step 1: Date parsing
-        try:
-            parsed_date_info = call_date_parser_agent(user_query)
-        except Exception as e:
-            logging.warning(f"⚠️ Agent fallback triggered: {e}")
-            parsed_date_info = fallback_date_parser(user_query)
-
-        # Step 2: Build filter
-        filter_expression = build_filter_expression(parsed_date_info)
-        if not filter_expression:
+        output = await process_query(raw_query)
+        if output is None:
             return func.HttpResponse("No valid date found in query.", status_code=400)
 
-        # Step 3: Call AOYD
-        gpt_response = call_rag_agent_with_filter(user_query, filter_expression)
-
         # Final response
-        output = {
-            "parsed_dates": parsed_date_info,
-            "filter": filter_expression,
-            "gpt_answer": gpt_response["choices"][0]["message"]["content"]
-        }
         return func.HttpResponse(
-            json.dumps(output, ensure_ascii=False),
+            orjson.dumps(output),
             mimetype="application/json",
             status_code=200
         )
 
     except Exception as e:
-        logging.exception("🔥 Unhandled error")
+        logger.exception("🔥 Unhandled error")
         return func.HttpResponse(
-            json.dumps({"error": str(e)}, ensure_ascii=False),
+            orjson.dumps({"error": str(e)}),
             mimetype="application/json",
             status_code=500
-        )
\ No newline at end of file
+        )
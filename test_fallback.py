@@ -1,11 +1,9 @@
 """
 Test the fallback date parser functionality directly
 """
-import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(__file__), 'seacrh_by_date'))
-
-from search_by_date import fallback_date_parser, build_filter_expression
+import asyncio
+import search_by_date
+from search_by_date import fallback_date_parser, build_filter_expression, _fast_classify, process_batch
 from datetime import datetime, timedelta
 
 def test_fallback_parser():
@@ -63,9 +61,73 @@ def test_date_calculations():
     expected_today = today.isoformat()
     print(f"Today test - Expected: {expected_today}, Got: {today_result.get('date')}")
     assert today_result.get('date') == expected_today, "Today calculation failed"
-    
+
+    # Test last week (Monday to Sunday of the previous week)
+    last_week_result = fallback_date_parser("la semana pasada")
+    expected_start = (today - timedelta(days=today.weekday() + 7)).isoformat()
+    print(f"Last week test - Expected start: {expected_start}, Got: {last_week_result.get('start')}")
+    assert last_week_result.get('start') == expected_start, "Last week calculation failed"
+
+    # Test last month (also the default for unrecognized phrases)
+    last_month_end = today.replace(day=1) - timedelta(days=1)
+    expected_last_month = {"start": last_month_end.replace(day=1).isoformat(), "end": last_month_end.isoformat()}
+    print(f"Last month test - Expected: {expected_last_month}, Got: {fallback_date_parser('mes pasado')}")
+    assert fallback_date_parser("mes pasado") == expected_last_month, "Last month calculation failed"
+    assert fallback_date_parser("reportes random text") == expected_last_month, "Default range calculation failed"
+
     print("✅ Date calculation tests passed!")
 
+def test_fast_classify():
+    """Test that only bare known phrases bypass the Azure AI agent"""
+    
+    print("\n🧪 Testing Fast Classifier")
+    print("=" * 50)
+    
+    today = datetime.now().date()
+    
+    for query in ["ayer", "¿La semana pasada?", "el mes pasado"]:
+        result = _fast_classify(query, today)
+        print(f"'{query}' -> {result}")
+        assert result == fallback_date_parser(query, today), f"Fast path mismatch for '{query}'"
+    
+    for query in ["producción de ayer en LA HOCHA", "hoy y el 23 de abril", "archivos de 2023"]:
+        result = _fast_classify(query, today)
+        print(f"'{query}' -> {result}")
+        assert result is None, f"'{query}' should go to the agent"
+    
+    print("✅ Fast classifier tests passed!")
+
+def test_process_batch():
+    """Test that batch results map 1:1 to the input queries"""
+    
+    print("\n🧪 Testing Batch Processing")
+    print("=" * 50)
+    
+    async def fake_process_query(raw_query):
+        if raw_query == "boom":
+            raise RuntimeError("agent down")
+        if raw_query == "sin fecha":
+            return None
+        return {"gpt_answer": raw_query}
+    
+    original = search_by_date.process_query
+    search_by_date.process_query = fake_process_query
+    try:
+        results = asyncio.run(process_batch(["ayer", "sin fecha", "boom"]))
+    finally:
+        search_by_date.process_query = original
+    
+    print(f"Results: {results}")
+    assert results == [
+        {"gpt_answer": "ayer"},
+        {"error": "No valid date found in query."},
+        {"error": "agent down"}
+    ], "Batch results do not map 1:1 to inputs"
+    
+    print("✅ Batch processing tests passed!")
+
 if __name__ == "__main__":
     test_fallback_parser()
     test_date_calculations()
+    test_fast_classify()
+    test_process_batch()